@@ -1,21 +1,25 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import logging
+import os
+from contextlib import asynccontextmanager
 
 # Import routers
-from auth.endpoints import router as auth_router
+from auth.endpoints import router as auth_router, BCRYPT_POOL
 from users.endpoints import router as users_router
 from buildings.endpoints import router as buildings_router
 from user_buildings.endpoints import router as user_buildings_router
 from user_fleets.endpoints import router as user_fleets_router
 from user_battles.endpoints import router as battle_router
 from planets.endpoints import router as planets_router
+from database.database import DATABASE_URL, POOL
 
 # -----------------------
 # Logging Setup
 # -----------------------
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
     format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
     filename="app_logs.log",
     filemode='a'
@@ -23,6 +27,25 @@ logging.basicConfig(
 
 logger = logging.getLogger("crimson_dominion")
 
+# -----------------------
+# Startup / Shutdown
+# -----------------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("🚀 Crimson Dominion API has launched.")
+    # An empty conninfo would make libpq fall back to PG* variables and the local socket,
+    # quietly reaching whatever database that finds; refuse to start instead
+    if not DATABASE_URL:
+        logger.critical("❌ DATABASE_URL is not set")
+        raise RuntimeError("DATABASE_URL is not set in environment variables")
+    # The pool fills in the background; the database check lives in /health so
+    # worker boot doesn't wait on a real connect
+    await POOL.open()
+    yield
+    await POOL.close()
+    BCRYPT_POOL.shutdown()
+    logger.info("🔒 Database pool closed.")
+
 # -----------------------
 # FastAPI App Setup
 # -----------------------
@@ -39,6 +62,8 @@ Use this API to manage players, battles, planets, buildings, and fleets.
         "email": "Moe.Yassir@gmail.com",
     },
     license_info={"name": "OpenSource / MIT"},
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
     debug=True
 )
 
@@ -53,21 +78,6 @@ app.include_router(user_fleets_router, prefix="/user-fleets", tags=["User Fleets
 app.include_router(battle_router, prefix="/user-battles", tags=["User Battles"])  # Corrected prefix
 app.include_router(planets_router, prefix="/planets", tags=["Planets"])
 
-# -----------------------
-# Startup Event
-# -----------------------
-@app.on_event("startup")
-def on_startup():
-    logger.info("🚀 Crimson Dominion API has launched.")
-    try:
-        from database.database import connect_to_db
-        conn = connect_to_db()
-        if conn:
-            logger.info("✅ Database connection successful at startup.")
-            conn.close()
-    except Exception as e:
-        logger.error(f"❌ Failed DB check at startup: {str(e)}")
-
 # -----------------------
 # Root Endpoint
 # -----------------------
@@ -75,9 +85,17 @@ def on_startup():
 def read_root():
     return {"message": "Welcome to the Crimson Dominion API — Rule the stars!"}
 
+@app.get("/health", tags=["Root"])
+async def health_check():
+    try:
+        async with POOL.connection() as conn:
+            await conn.execute("SELECT 1")
+    except Exception as e:
+        logger.error("❌ Health check failed: %s", e)
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    return {"status": "ok"}
+
 # -----------------------
-# Run with Uvicorn
+# Run with Gunicorn
 # -----------------------
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run("main:app", host="127.0.0.1", port=8000)  # reload=True for dev
+# gunicorn app.main:app -c gunicorn_conf.py
@@ -1,9 +1,15 @@
 import os
+import time
+import logging
+import psycopg
+import asyncio
+import bcrypt
+from concurrent.futures import ProcessPoolExecutor
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from jose import JWTError, jwt
-from datetime import datetime, timedelta
-from database.database import connect_to_db
+from cachetools import TTLCache
+import jwt
+from database.database import POOL
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from dotenv import load_dotenv
@@ -17,13 +23,33 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 REFRESH_SECRET_KEY = os.getenv("REFRESH_SECRET_KEY", "your-refresh-secret-key")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
-REFRESH_TOKEN_EXPIRE_DAYS = 7
+ACCESS_TOKEN_EXPIRE_SECONDS = 30 * 60
+REFRESH_TOKEN_EXPIRE_SECONDS = 7 * 86400
+TOKEN_CACHE_TTL_SECONDS = 60
+USER_CACHE_TTL_SECONDS = 5
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+# Only kept to verify hashes bcrypt itself can't read; new hashes go straight through bcrypt
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = 12
+
+# bcrypt is deliberately CPU-heavy; run it in worker processes so it uses spare cores
+# instead of holding the GIL while other requests wait. The pool is per app process; a single
+# process gets one bcrypt worker per core, and gunicorn_conf.py shrinks it for multi-worker runs.
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS") or os.cpu_count() or 1)
+BCRYPT_POOL = ProcessPoolExecutor(max_workers=BCRYPT_WORKERS)
+
+# Successfully decoded access tokens, keyed by the raw token: (TokenData, exp)
+_TOKEN_CACHE = TTLCache(maxsize=10000, ttl=TOKEN_CACHE_TTL_SECONDS)
+
+# Recently read user rows (no password hash), keyed by lowercased username and by id, so
+# polling /me and /users/{id} doesn't hit the database every time. Per process: other workers
+# can serve a row up to USER_CACHE_TTL_SECONDS old after an admin edit, so login never uses them.
+USER_BY_NAME_CACHE = TTLCache(maxsize=10000, ttl=USER_CACHE_TTL_SECONDS)
+USER_BY_ID_CACHE = TTLCache(maxsize=10000, ttl=USER_CACHE_TTL_SECONDS)
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # ------------------------
 # Schemas
@@ -49,7 +75,7 @@ class Token(BaseModel):
     token_type: str
 
 class TokenData(BaseModel):
-    id: str
+    id: UUID
     username: str
     is_admin: bool
 
@@ -58,38 +84,62 @@ class TokenData(BaseModel):
 # ------------------------
 
 def hash_password(password):
-    return pwd_context.hash(password)
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode()
 
 def verify_password(plain, hashed):
-    return pwd_context.verify(plain, hashed)
+    if not hashed.startswith(("$2a$", "$2b$", "$2y$")):
+        return pwd_context.verify(plain, hashed)
+    return bcrypt.checkpw(plain.encode(), hashed.encode())
 
-def create_access_token(data: dict, expires_delta: timedelta = None):
+# Pay bcrypt's one-off setup at import (also in each worker process) rather than on the first login
+bcrypt.hashpw(b"warm-up", bcrypt.gensalt(rounds=4))
+
+def create_access_token(data: dict, expires_delta: int = None):
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    to_encode["exp"] = int(time.time()) + (expires_delta or ACCESS_TOKEN_EXPIRE_SECONDS)
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 def create_refresh_token(data: dict):
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire})
+    to_encode["exp"] = int(time.time()) + REFRESH_TOKEN_EXPIRE_SECONDS
     return jwt.encode(to_encode, REFRESH_SECRET_KEY, algorithm=ALGORITHM)
 
-def get_user_by_username(username: str):
-    print(f"🔍 Fetching user: {username}")
-    conn = connect_to_db()
-    if not conn:
-        print("❌ DB connection failed")
-        return None
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT id, username, email, password, is_admin FROM users WHERE username = %s", (username,))
-            return cursor.fetchone()
-    finally:
-        conn.close()
-
-def get_current_user(token: str = Depends(oauth2_scheme)) -> TokenData:
-    print("🔐 Validating token...")
+async def get_user_by_username(username: str):
+    logger.debug("🔍 Fetching user: %s", username)
+    key = username.lower()
+    user = USER_BY_NAME_CACHE.get(key)
+    if user is None:
+        # Only a cache miss takes a pooled connection
+        async with POOL.connection() as conn, conn.cursor() as cursor:
+            await cursor.execute("SELECT id, username, email, is_admin FROM users WHERE lower(username) = lower(%s)", (username,), prepare=True)
+            user = await cursor.fetchone()
+        if user is not None:
+            USER_BY_NAME_CACHE[key] = user
+    return user
+
+# Drops every cached user row; admin edits are rare enough not to bother picking entries out.
+# Only call this once the change has committed: any earlier and a concurrent read could
+# re-cache the old row.
+def forget_cached_users():
+    USER_BY_NAME_CACHE.clear()
+    USER_BY_ID_CACHE.clear()
+
+# Runs an admin update or delete of a user row in its own transaction, then forgets the cached
+# users. Returns False when no row matched.
+async def write_user(query: str, params: tuple) -> bool:
+    async with POOL.connection() as conn, conn.cursor() as cursor:
+        await cursor.execute(query, params)
+        if cursor.rowcount == 0:
+            return False
+    forget_cached_users()
+    return True
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> TokenData:
+    logger.debug("🔐 Validating token...")
+    cached = _TOKEN_CACHE.get(token)
+    if cached and cached[1] > time.time():
+        return cached[0]
+
     credentials_exception = HTTPException(
         status_code=401,
         detail="Could not validate credentials",
@@ -102,9 +152,12 @@ def get_current_user(token: str = Depends(oauth2_scheme)) -> TokenData:
         is_admin: bool = payload.get("is_admin")
         if not all([user_id, username, is_admin is not None]):
             raise credentials_exception
-        return TokenData(id=user_id, username=username, is_admin=is_admin)
-    except JWTError as e:
-        print(f"❌ Token decode error: {e}")
+        token_data = TokenData(id=user_id, username=username, is_admin=is_admin)
+        # Cache entries expire after TOKEN_CACHE_TTL_SECONDS or at the token's own exp, whichever is first
+        _TOKEN_CACHE[token] = (token_data, payload.get("exp", 0))
+        return token_data
+    except jwt.PyJWTError as e:
+        logger.warning("❌ Token decode error: %s", e)
         raise credentials_exception
 
 # ------------------------
@@ -112,18 +165,22 @@ def get_current_user(token: str = Depends(oauth2_scheme)) -> TokenData:
 # ------------------------
 
 @router.post("/login", response_model=Token)
-def login(form_data: UserLogin):
-    print(f"🔐 Login attempt: {form_data.username}")
-    user = get_user_by_username(form_data.username)
-    if user is None or not verify_password(form_data.password, user[3]):
-        print("❌ Invalid credentials")
+async def login(form_data: UserLogin):
+    logger.debug("🔐 Login attempt: %s", form_data.username)
+    # Read fresh rather than through the user cache, so a just-deleted or demoted user can't get
+    # a token from another worker's stale row; the connection goes back before bcrypt runs
+    async with POOL.connection() as conn, conn.cursor() as cursor:
+        await cursor.execute("SELECT id, username, email, password, is_admin FROM users WHERE lower(username) = lower(%s)", (form_data.username,), prepare=True)
+        user = await cursor.fetchone()
+    if user is None or not await asyncio.get_running_loop().run_in_executor(BCRYPT_POOL, verify_password, form_data.password, user[3]):
+        logger.warning("❌ Invalid credentials")
         raise HTTPException(status_code=401, detail="Invalid username or password")
 
     payload = {"id": str(user[0]), "sub": user[1], "is_admin": user[4]}
     access_token = create_access_token(payload)
     refresh_token = create_refresh_token(payload)
 
-    print("✅ Login successful")
+    logger.debug("✅ Login successful")
     return {
         "access_token": access_token,
         "refresh_token": refresh_token,
@@ -131,8 +188,8 @@ def login(form_data: UserLogin):
     }
 
 @router.post("/refresh", response_model=Token)
-def refresh_token(refresh_token: str):
-    print("🔄 Refreshing token...")
+async def refresh_token(refresh_token: str):
+    logger.debug("🔄 Refreshing token...")
     try:
         payload = jwt.decode(refresh_token, REFRESH_SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("id")
@@ -144,157 +201,123 @@ def refresh_token(refresh_token: str):
         new_access_token = create_access_token({"id": user_id, "sub": username, "is_admin": is_admin})
         new_refresh_token = create_refresh_token({"id": user_id, "sub": username, "is_admin": is_admin})
 
-        print("✅ Token refreshed")
+        logger.debug("✅ Token refreshed")
         return {
             "access_token": new_access_token,
             "refresh_token": new_refresh_token,
             "token_type": "bearer"
         }
 
-    except JWTError as e:
-        print(f"❌ Refresh token error: {e}")
+    except jwt.PyJWTError as e:
+        logger.warning("❌ Refresh token error: %s", e)
         raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
 
 @router.post("/register")
-def register_user(user_data: UserRegister):
-    print(f"📝 Registering user: {user_data.username}")
-    conn = connect_to_db()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+async def register_user(user_data: UserRegister):
+    logger.debug("📝 Registering user: %s", user_data.username)
 
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT id FROM users WHERE username = %s", (user_data.username,))
-            if cursor.fetchone():
-                raise HTTPException(status_code=400, detail="Username already taken")
-
-            cursor.execute("SELECT id FROM users WHERE email = %s", (user_data.email,))
-            if cursor.fetchone():
-                raise HTTPException(status_code=400, detail="Email already in use")
-
-            hashed_pw = hash_password(user_data.password)
-
-            cursor.execute("""
+        # Check both uniqueness rules in one round trip
+        async with POOL.connection() as conn, conn.cursor() as cursor:
+            await cursor.execute("""
+                SELECT bool_or(lower(username) = lower(%s)), bool_or(lower(email) = lower(%s))
+                FROM users WHERE lower(username) = lower(%s) OR lower(email) = lower(%s)
+            """, (user_data.username, user_data.email, user_data.username, user_data.email))
+            username_taken, email_taken = await cursor.fetchone()
+        if username_taken:
+            raise HTTPException(status_code=400, detail="Username already taken")
+        if email_taken:
+            raise HTTPException(status_code=400, detail="Email already in use")
+
+        # Hash with no connection checked out, so slow bcrypt calls can't drain the pool
+        hashed_pw = await asyncio.get_running_loop().run_in_executor(BCRYPT_POOL, hash_password, user_data.password)
+
+        async with POOL.connection() as conn, conn.cursor() as cursor:
+            await cursor.execute("""
                 INSERT INTO users (username, email, password, is_admin)
                 VALUES (%s, %s, %s, %s)
                 RETURNING id;
             """, (user_data.username, user_data.email, hashed_pw, False))
+            new_user_id = (await cursor.fetchone())[0]
 
-            new_user_id = cursor.fetchone()[0]
-            conn.commit()
-
-            print(f"✅ User registered: {new_user_id}")
-            return {"message": "User created successfully", "user_id": new_user_id}
+        logger.info("✅ User registered: %s", new_user_id)
+        return {"message": "User created successfully", "user_id": new_user_id}
 
-    except Exception as e:
-        print(f"❌ Error creating user: {e}")
-        raise HTTPException(status_code=500, detail=f"Error creating user: {str(e)}")
-    finally:
-        conn.close()
+    except psycopg.Error as e:
+        logger.error("❌ Error creating user: %s", e)
+        raise HTTPException(status_code=500, detail="Error creating user")
 
 @router.post("/register-admin")
-def register_admin(admin_data: UserRegister):
-    print(f"🛡️ Registering admin: {admin_data.username}")
-    conn = connect_to_db()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+async def register_admin(admin_data: UserRegister):
+    logger.debug("🛡️ Registering admin: %s", admin_data.username)
 
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT id FROM users WHERE username = %s", (admin_data.username,))
-            if cursor.fetchone():
-                raise HTTPException(status_code=400, detail="Username already taken")
-
-            cursor.execute("SELECT id FROM users WHERE email = %s", (admin_data.email,))
-            if cursor.fetchone():
-                raise HTTPException(status_code=400, detail="Email already in use")
-
-            hashed_pw = hash_password(admin_data.password)
-
-            cursor.execute("""
+        # Check both uniqueness rules in one round trip
+        async with POOL.connection() as conn, conn.cursor() as cursor:
+            await cursor.execute("""
+                SELECT bool_or(lower(username) = lower(%s)), bool_or(lower(email) = lower(%s))
+                FROM users WHERE lower(username) = lower(%s) OR lower(email) = lower(%s)
+            """, (admin_data.username, admin_data.email, admin_data.username, admin_data.email))
+            username_taken, email_taken = await cursor.fetchone()
+        if username_taken:
+            raise HTTPException(status_code=400, detail="Username already taken")
+        if email_taken:
+            raise HTTPException(status_code=400, detail="Email already in use")
+
+        # Hash with no connection checked out, so slow bcrypt calls can't drain the pool
+        hashed_pw = await asyncio.get_running_loop().run_in_executor(BCRYPT_POOL, hash_password, admin_data.password)
+
+        async with POOL.connection() as conn, conn.cursor() as cursor:
+            await cursor.execute("""
                 INSERT INTO users (username, email, password, is_admin)
                 VALUES (%s, %s, %s, %s)
                 RETURNING id;
             """, (admin_data.username, admin_data.email, hashed_pw, True))
+            new_user_id = (await cursor.fetchone())[0]
 
-            new_user_id = cursor.fetchone()[0]
-            conn.commit()
+        logger.info("✅ Admin registered: %s", new_user_id)
+        return {"message": "Admin user created successfully", "user_id": new_user_id}
 
-            print(f"✅ Admin registered: {new_user_id}")
-            return {"message": "Admin user created successfully", "user_id": new_user_id}
-
-    except Exception as e:
-        print(f"❌ Error creating admin: {e}")
-        raise HTTPException(status_code=500, detail=f"Error creating admin: {str(e)}")
-    finally:
-        conn.close()
+    except psycopg.Error as e:
+        logger.error("❌ Error creating admin: %s", e)
+        raise HTTPException(status_code=500, detail="Error creating admin")
 
 @router.put("/update_user/{user_id}")
-def update_user(user_id: str, user_data: UserUpdate, current_user: TokenData = Depends(get_current_user)):
-    print(f"✏️ Update request for user {user_id}")
-    try:
-        user_uuid = UUID(user_id)
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid user ID format")
+async def update_user(user_id: UUID, user_data: UserUpdate, current_user: TokenData = Depends(get_current_user)):
+    logger.debug("✏️ Update request for user %s", user_id)
 
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Only admins can update user data")
 
-    conn = connect_to_db()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT id FROM users WHERE id = %s", (user_uuid,))
-            if not cursor.fetchone():
-                raise HTTPException(status_code=404, detail="User not found")
-
-            cursor.execute("""
-                UPDATE users 
-                SET username = %s, email = %s, is_admin = %s 
-                WHERE id = %s
-            """, (user_data.username, user_data.email, user_data.is_admin, user_uuid))
-            conn.commit()
-            print("✅ User updated")
-
-    except Exception as e:
-        print(f"❌ Error updating user: {e}")
-        raise HTTPException(status_code=500, detail=f"Error updating user: {str(e)}")
-    finally:
-        conn.close()
+        if not await write_user("""
+            UPDATE users
+            SET username = %s, email = %s, is_admin = %s
+            WHERE id = %s
+        """, (user_data.username, user_data.email, user_data.is_admin, user_id)):
+            raise HTTPException(status_code=404, detail="User not found")
+        logger.debug("✅ User updated")
+
+    except psycopg.Error as e:
+        logger.error("❌ Error updating user: %s", e)
+        raise HTTPException(status_code=500, detail="Error updating user")
 
     return {"message": "User updated successfully"}
 
 @router.delete("/delete_user/{user_id}")
-def delete_user(user_id: str, current_user: TokenData = Depends(get_current_user)):
-    print(f"🗑️ Delete request for user: {user_id}")
-    try:
-        user_uuid = UUID(user_id)
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid user ID format")
+async def delete_user(user_id: UUID, current_user: TokenData = Depends(get_current_user)):
+    logger.debug("🗑️ Delete request for user: %s", user_id)
 
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Only admins can delete users")
 
-    conn = connect_to_db()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT id FROM users WHERE id = %s", (user_uuid,))
-            if not cursor.fetchone():
-                raise HTTPException(status_code=404, detail="User not found")
-
-            cursor.execute("DELETE FROM users WHERE id = %s", (user_uuid,))
-            conn.commit()
-            print("✅ User deleted")
-
-    except Exception as e:
-        print(f"❌ Error deleting user: {e}")
-        raise HTTPException(status_code=500, detail=f"Error deleting user: {str(e)}")
-    finally:
-        conn.close()
+        if not await write_user("DELETE FROM users WHERE id = %s", (user_id,)):
+            raise HTTPException(status_code=404, detail="User not found")
+        logger.debug("✅ User deleted")
+
+    except psycopg.Error as e:
+        logger.error("❌ Error deleting user: %s", e)
+        raise HTTPException(status_code=500, detail="Error deleting user")
 
     return {"message": "User deleted successfully"}
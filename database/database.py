@@ -1,132 +1,194 @@
 import os
+import re
+import logging
 import psycopg
+import orjson
+from psycopg.rows import dict_row
+from psycopg.types.json import set_json_dumps, set_json_loads
 from dotenv import load_dotenv
 from fastapi import HTTPException
-from uuid import UUID
+from psycopg_pool import AsyncConnectionPool
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Database connection function
-def connect_to_db():
-    DATABASE_URL = os.getenv("DATABASE_URL")
-    if not DATABASE_URL:
-        raise HTTPException(status_code=500, detail="Database URL is not set in environment variables")
+# Read once at import for the pool; app startup refuses to run without it
+DATABASE_URL = os.getenv("DATABASE_URL")
 
-    try:
-        print("🔌 Connecting to database...")
-        return psycopg.connect(DATABASE_URL)
-    except Exception as e:
-        print(f"❌ Database connection error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Database connection error: {str(e)}")
+logger = logging.getLogger(__name__)
+
+# Canonical 8-4-4-4-12 UUID text. Checking ids against this instead of parsing them with UUID()
+# skips building an object (and an exception on bad input); Postgres parses the bound text itself.
+UUID_RE = re.compile(r"\A[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\Z")
+
+# Pool sizing is per worker process. By default psycopg prepares a query server-side from its
+# second execution on, so repeated lookups skip Postgres' parse/plan step. Behind pgbouncer in
+# transaction pooling mode set DB_PREPARE_THRESHOLD=none, since prepared statements don't follow
+# a client from one server connection to the next. The lookups every request leans on pass
+# prepare=True to be prepared on first use; psycopg ignores that when the threshold is none.
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "5"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+_prepare_threshold = os.getenv("DB_PREPARE_THRESHOLD", "1")
+DB_PREPARE_THRESHOLD = None if _prepare_threshold.lower() in ("", "none") else int(_prepare_threshold)
+
+# Room for 256 prepared queries per connection (psycopg's default is 100). prepared_max
+# isn't a connect() argument, so it's set on each new pooled connection instead.
+PREPARED_MAX = 256
+
+async def _configure_async(conn):
+    conn.prepared_max = PREPARED_MAX
+
+# jsonb columns go through orjson on the way in and out
+set_json_dumps(orjson.dumps)
+set_json_loads(orjson.loads)
+
+# Shared connection pool, opened on app startup and closed on shutdown. Building it doesn't
+# connect, so importing this module without DATABASE_URL set is fine.
+POOL = AsyncConnectionPool(
+    DATABASE_URL or "",
+    min_size=DB_POOL_MIN_SIZE,
+    max_size=DB_POOL_MAX_SIZE,
+    kwargs={"prepare_threshold": DB_PREPARE_THRESHOLD},
+    configure=_configure_async,
+    open=False,
+)
+
+_SQL_GET_USER = "SELECT id, username, email, is_admin FROM users WHERE id = %s"
+_SQL_LIST_USERS = "SELECT id, username, email, is_admin FROM users"
+_SQL_CREATE_USER = """
+    INSERT INTO users (username, email, password, is_admin)
+    VALUES (%s, %s, %s, %s) RETURNING id
+"""
+_SQL_UPDATE_USER = """
+    UPDATE users
+    SET username = %s, email = %s, is_admin = %s
+    WHERE id = %s
+"""
+_SQL_DELETE_USER = "DELETE FROM users WHERE id = %s"
+
+# FastAPI dependency yielding a cursor on a pooled connection.
+# The transaction is committed when the route returns and rolled back if it raises.
+async def get_cursor():
+    async with POOL.connection() as conn:
+        async with conn.cursor() as cursor:
+            try:
+                yield cursor
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+
+# Called right after an UPDATE/DELETE filtered on both the row id and its owner. When that
+# matched nothing, a second lookup by id alone tells a missing row (404) from one the user
+# doesn't own (denied_status, 403 unless the route means something else by it).
+async def check_owned_write(cursor, exists_query: str, row_id, not_found: str, denied: str, denied_status: int = 403):
+    if cursor.rowcount != 0:
+        return
+    await cursor.execute(exists_query, (row_id,))
+    if not await cursor.fetchone():
+        logger.warning("❌ %s: %s", not_found, row_id)
+        raise HTTPException(status_code=404, detail=not_found)
+    logger.warning("❌ %s: %s", denied, row_id)
+    raise HTTPException(status_code=denied_status, detail=denied)
+
+# Rows fetched per round trip by stream_json_array
+STREAM_BATCH_SIZE = 500
+
+# Rows of a query as the chunks of a JSON array, read through a server-side cursor
+# STREAM_BATCH_SIZE at a time so neither the result set nor its JSON is ever held in memory
+# whole. The connection is its own, since the body is sent after get_cursor has finished.
+async def _json_array_chunks(query: str, params: tuple):
+    async with POOL.connection() as conn:
+        async with conn.cursor(name="stream_json_array", row_factory=dict_row) as cursor:
+            await cursor.execute(query, params, binary=True)
+            rows = await cursor.fetchmany(STREAM_BATCH_SIZE)
+            yield b"["
+            separator = b""
+            while rows:
+                for row in rows:
+                    yield separator + orjson.dumps(row)
+                    separator = b","
+                rows = await cursor.fetchmany(STREAM_BATCH_SIZE)
+            yield b"]"
+
+async def _chain(first: bytes, rest):
+    yield first
+    async for chunk in rest:
+        yield chunk
+
+# Body for a StreamingResponse of a query's rows as a JSON array. Getting the connection,
+# running the query and fetching the first batch all happen here, before the response
+# starts, so a database that is down or a failing query raises psycopg.Error to the route
+# (and a 500) instead of reaching the client as a 200 with an empty body.
+async def stream_json_array(query: str, params: tuple = ()):
+    chunks = _json_array_chunks(query, params)
+    # Runs the generator up to its opening bracket
+    first = await chunks.__anext__()
+    return _chain(first, chunks)
 
 # Get a user by ID
-def get_user_by_id(user_id: str):
-    try:
-        user_uuid = UUID(user_id)
-        print(f"🔍 Fetching user by ID: {user_uuid}")
-    except ValueError:
+async def get_user_by_id(user_id: str):
+    if not UUID_RE.match(user_id):
         raise HTTPException(status_code=400, detail="Invalid user ID format")
+    logger.debug("🔍 Fetching user by ID: %s", user_id)
 
-    conn = connect_to_db()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT id, username, email, is_admin FROM users WHERE id = %s", (user_uuid,))
-                user = cursor.fetchone()
-                if user:
-                    print(f"✅ User found: {user}")
-                else:
-                    print(f"❌ User not found for ID: {user_uuid}")
-        finally:
-            conn.close()
-        return user
-    return None
+    async with POOL.connection() as conn, conn.cursor() as cursor:
+        await cursor.execute(_SQL_GET_USER, (user_id,), prepare=True)
+        user = await cursor.fetchone()
+    if user:
+        logger.debug("✅ User found: %s", user)
+    else:
+        logger.warning("❌ User not found for ID: %s", user_id)
+    return user
 
 # Function to get all users (for admin purposes)
-def get_all_users():
-    conn = connect_to_db()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                print("📋 Fetching all users")
-                cursor.execute("SELECT id, username, email, is_admin FROM users")
-                users = cursor.fetchall()
-                print(f"✅ Found {len(users)} users")
-        finally:
-            conn.close()
-        return users
-    return None
+async def get_all_users():
+    logger.debug("📋 Fetching all users")
+    async with POOL.connection() as conn, conn.cursor() as cursor:
+        await cursor.execute(_SQL_LIST_USERS)
+        users = await cursor.fetchall()
+    logger.debug("✅ Found %s users", len(users))
+    return users
 
 # Function to create a new user
-def create_user(username: str, email: str, password: str, is_admin: bool = False):
-    conn = connect_to_db()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                print(f"👤 Creating user: {username}, admin: {is_admin}")
-                cursor.execute("""
-                    INSERT INTO users (username, email, password, is_admin)
-                    VALUES (%s, %s, %s, %s) RETURNING id;
-                """, (username, email, password, is_admin))
-                user_id = cursor.fetchone()[0]
-                conn.commit()
-                print(f"✅ User created with ID: {user_id}")
-            conn.close()
-            return user_id
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            print(f"❌ Error creating user: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error creating user: {str(e)}")
-    raise HTTPException(status_code=500, detail="Database connection error")
+async def create_user(username: str, email: str, password: str, is_admin: bool = False):
+    logger.debug("👤 Creating user: %s, admin: %s", username, is_admin)
+    try:
+        # transaction() commits on success and rolls back if anything inside raises;
+        # the pool takes the connection back either way
+        async with POOL.connection() as conn, conn.transaction(), conn.cursor() as cursor:
+            await cursor.execute(_SQL_CREATE_USER, (username, email, password, is_admin))
+            user_id = (await cursor.fetchone())[0]
+    except psycopg.Error as e:
+        logger.error("❌ Error creating user: %s", e)
+        raise HTTPException(status_code=500, detail="Error creating user")
+    logger.debug("✅ User created with ID: %s", user_id)
+    return user_id
 
 # Function to update user data
-def update_user(user_id: str, username: str, email: str, is_admin: bool):
-    try:
-        user_uuid = UUID(user_id)
-        print(f"✏️ Updating user {user_uuid}")
-    except ValueError:
+async def update_user(user_id: str, username: str, email: str, is_admin: bool):
+    if not UUID_RE.match(user_id):
         raise HTTPException(status_code=400, detail="Invalid user ID format")
+    logger.debug("✏️ Updating user %s", user_id)
 
-    conn = connect_to_db()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute("""
-                    UPDATE users
-                    SET username = %s, email = %s, is_admin = %s
-                    WHERE id = %s
-                """, (username, email, is_admin, user_uuid))
-                conn.commit()
-                print(f"✅ User {user_uuid} updated successfully")
-            conn.close()
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            print(f"❌ Error updating user: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error updating user: {str(e)}")
-    raise HTTPException(status_code=500, detail="Database connection error")
+    try:
+        async with POOL.connection() as conn, conn.transaction(), conn.cursor() as cursor:
+            await cursor.execute(_SQL_UPDATE_USER, (username, email, is_admin, user_id))
+    except psycopg.Error as e:
+        logger.error("❌ Error updating user: %s", e)
+        raise HTTPException(status_code=500, detail="Error updating user")
+    logger.debug("✅ User %s updated successfully", user_id)
 
 # Function to delete a user by ID
-def delete_user(user_id: str):
-    try:
-        user_uuid = UUID(user_id)
-        print(f"🗑️ Deleting user {user_uuid}")
-    except ValueError:
+async def delete_user(user_id: str):
+    if not UUID_RE.match(user_id):
         raise HTTPException(status_code=400, detail="Invalid user ID format")
+    logger.debug("🗑️ Deleting user %s", user_id)
 
-    conn = connect_to_db()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute("DELETE FROM users WHERE id = %s", (user_uuid,))
-                conn.commit()
-                print(f"✅ User {user_uuid} deleted successfully")
-            conn.close()
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            print(f"❌ Error deleting user: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error deleting user: {str(e)}")
-    raise HTTPException(status_code=500, detail="Database connection error")
+    try:
+        async with POOL.connection() as conn, conn.transaction(), conn.cursor() as cursor:
+            await cursor.execute(_SQL_DELETE_USER, (user_id,))
+    except psycopg.Error as e:
+        logger.error("❌ Error deleting user: %s", e)
+        raise HTTPException(status_code=500, detail="Error deleting user")
+    logger.debug("✅ User %s deleted successfully", user_id)
@@ -0,0 +1,4 @@
+-- Let Postgres generate primary keys so inserts can rely on RETURNING id
+-- instead of generating and sending a uuid4() from Python.
+ALTER TABLE users ALTER COLUMN id SET DEFAULT gen_random_uuid();
+ALTER TABLE buildings ALTER COLUMN id SET DEFAULT gen_random_uuid();
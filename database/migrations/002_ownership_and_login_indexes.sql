@@ -0,0 +1,8 @@
+-- Indexes behind the ownership joins (buildings -> planets -> user) and the
+-- case-insensitive username/email lookups used by login and registration.
+-- CONCURRENTLY avoids locking out writes on live tables, but can't run inside a
+-- transaction block: apply with psql, which runs each statement on its own.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_planets_user_id ON planets (user_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_buildings_planet_id ON buildings (planet_id);
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_users_lower_username ON users (lower(username));
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_users_lower_email ON users (lower(email));
@@ -0,0 +1,6 @@
+-- Covering index for the per-user listing.
+-- user_buildings listings filter on user_id and return the included columns straight from the index.
+-- Planet ownership checks ("planet id X owned by user Y") use the planets primary key. A second
+-- (id) INCLUDE (user_id) index would only add write cost to every planet insert, update and claim.
+-- planets(user_id) already comes from 002. Apply with psql, since CONCURRENTLY can't run in a transaction.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_buildings_user_id ON user_buildings (user_id) INCLUDE (id, name, planet_id, level);
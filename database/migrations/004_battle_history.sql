@@ -0,0 +1,17 @@
+-- Battle history written by POST /user-battles/battle.
+-- No foreign keys, so a battle's record outlives the fleets and users it names.
+-- Named apart from any existing battles table, and without IF NOT EXISTS, so a clash
+-- fails the migration instead of leaving start_battle to fail on every insert.
+CREATE TABLE battle_history (
+    id UUID PRIMARY KEY,
+    attacker_id UUID NOT NULL,
+    defender_id UUID NOT NULL,
+    attacker_fleet_id UUID NOT NULL,
+    defender_fleet_id UUID NOT NULL,
+    winner_id UUID NOT NULL,
+    loser_id UUID NOT NULL,
+    attacker_total_ships BIGINT NOT NULL,
+    defender_total_ships BIGINT NOT NULL,
+    report TEXT NOT NULL,
+    fought_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,3 @@
+-- Store fleet ships as jsonb so psycopg hands them over as dicts and
+-- start_battle can sum them without a cast. Rewrites the table, so run it off-peak.
+ALTER TABLE user_fleets ALTER COLUMN ships TYPE jsonb USING ships::jsonb;
@@ -0,0 +1,21 @@
+import os
+
+# Run with: gunicorn app.main:app -c gunicorn_conf.py
+#
+# Each worker is its own process with its own event loop and connection pool, so point
+# DATABASE_URL at pgbouncer (transaction pooling, e.g. pgbouncer:6432) to multiplex every
+# worker's pool onto a small number of real Postgres connections.
+
+bind = os.getenv("BIND", "127.0.0.1:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", 2 * (os.cpu_count() or 1) + 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Smaller per-worker pools unless overridden; workers inherit this environment
+os.environ.setdefault("DB_POOL_MIN_SIZE", "2")
+os.environ.setdefault("DB_POOL_MAX_SIZE", "10")
+# No server-side prepared statements, which break under pgbouncer's transaction pooling.
+# Set DB_PREPARE_THRESHOLD=1 when connecting straight to Postgres (see database/database.py).
+os.environ.setdefault("DB_PREPARE_THRESHOLD", "none")
+# Every worker also starts its own bcrypt process pool (auth/endpoints.py); with ~2 workers
+# per core, one bcrypt process each already covers the cores
+os.environ.setdefault("BCRYPT_WORKERS", "1")
@@ -1,11 +1,14 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from uuid import uuid4, UUID
-import json
+from uuid import uuid4
+import logging
+import psycopg
 
-from users.endpoints import get_user_by_username, get_user_by_id
-from auth.endpoints import get_current_user
-from database.database import connect_to_db
+from auth.endpoints import TokenData, get_current_user
+from psycopg import AsyncCursor
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+from database.database import UUID_RE, check_owned_write, get_cursor
 
 
 class Planet(BaseModel):
@@ -16,302 +19,170 @@ class Planet(BaseModel):
 
 
 router = APIRouter()
-
-
-def validate_uuid(uuid_str: str) -> UUID:
-    print(f"Validating UUID: {uuid_str}")
-    try:
-        return UUID(uuid_str)
-    except ValueError:
+logger = logging.getLogger(__name__)
+
+_SQL_CREATE_PLANET = """
+    INSERT INTO planets (id, name, user_id, resources, discovered_at, claimed_at)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    RETURNING id
+"""
+_SQL_GET_PLANET_WITH_OWNER = """
+    SELECT p.id, p.name, p.user_id, p.resources, p.discovered_at, p.claimed_at, u.username
+    FROM planets p LEFT JOIN users u ON u.id = p.user_id
+    WHERE p.id = %s
+"""
+_SQL_LIST_PLANETS = """
+    SELECT id, name, resources, discovered_at, claimed_at
+    FROM planets WHERE user_id = %s
+"""
+_SQL_UPDATE_OWN_PLANET = """
+    UPDATE planets
+    SET name = %s, resources = %s, discovered_at = %s, claimed_at = %s
+    WHERE id = %s AND user_id = %s
+"""
+_SQL_DELETE_OWN_PLANET = "DELETE FROM planets WHERE id = %s AND user_id = %s"
+_SQL_CLAIM_PLANET = """
+    UPDATE planets
+    SET claimed_at = NOW(), user_id = %s
+    WHERE id = %s AND user_id IS DISTINCT FROM %s
+"""
+_SQL_PLANET_EXISTS = "SELECT 1 FROM planets WHERE id = %s"
+
+
+def validate_uuid(uuid_str: str) -> str:
+    logger.debug("Validating UUID: %s", uuid_str)
+    if not UUID_RE.match(uuid_str):
         raise HTTPException(status_code=400, detail=f"Invalid UUID format: {uuid_str}")
+    return uuid_str
 
 
 @router.post("/")
-def create_planet(planet: Planet, current_user: dict = Depends(get_current_user)):
-    print("🌍 Create Planet endpoint hit")
-    print(f"🔐 Current user: {current_user}")
-
-    conn = connect_to_db()
-    if not conn:
-        print("❌ Database connection failed")
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    else:
-        print("✅ Database connection successful")
-
-    user = get_user_by_username(current_user.username)
-    if not user:
-        print("❌ User not found in DB")
-        raise HTTPException(status_code=404, detail="User not found")
-
-    user_id = str(user[0])
-    print(f"User found. ID: {user_id}")
+async def create_planet(planet: Planet, current_user: TokenData = Depends(get_current_user), cursor: AsyncCursor = Depends(get_cursor)):
+    logger.debug("🌍 Create Planet endpoint hit")
+    logger.debug("🔐 Current user: %s", current_user)
+
+    # The token already carries the user's id, so there's no users lookup per request
+    user_id = current_user.id
     planet_id = uuid4()
-    print(f"Generated new planet ID: {planet_id}")
-    resources_json = json.dumps(planet.resources)
-    print(f"Resources as JSON: {resources_json}")
+    logger.debug("Generated new planet ID: %s", planet_id)
 
     try:
-        with conn.cursor() as cursor:
-            print("📝 Inserting planet data into the database")
-            cursor.execute("""
-                INSERT INTO planets (id, name, user_id, resources, discovered_at, claimed_at) 
-                VALUES (%s, %s, %s, %s, %s, %s)
-                RETURNING id;
-            """, (planet_id, planet.name, user_id, resources_json, planet.discovered_at, planet.claimed_at))
-            conn.commit()
-            print("✅ Planet created successfully")
-    except Exception as e:
-        print(f"❌ Error during DB insert: {e}")
-        raise HTTPException(status_code=500, detail=f"Error creating planet: {str(e)}")
-    finally:
-        conn.close()
-        print("🔒 Database connection closed.")
+        logger.debug("📝 Inserting planet data into the database")
+        await cursor.execute(_SQL_CREATE_PLANET, (planet_id, planet.name, user_id, Jsonb(planet.resources), planet.discovered_at, planet.claimed_at))
+        logger.debug("✅ Planet created successfully")
+    except psycopg.Error as e:
+        logger.error("❌ Error during DB insert: %s", e)
+        raise HTTPException(status_code=500, detail="Error creating planet")
 
     return {"id": str(planet_id), "name": planet.name, "owner_id": user_id}
 
 
 @router.get("/{planet_id}")
-def read_planet(planet_id: str, current_user: dict = Depends(get_current_user)):
-    print(f"🌍 Reading planet with ID: {planet_id}")
+async def read_planet(planet_id: str, current_user: TokenData = Depends(get_current_user), cursor: AsyncCursor = Depends(get_cursor)):
+    logger.debug("🌍 Reading planet with ID: %s", planet_id)
     validate_uuid(planet_id)
 
-    conn = connect_to_db()
-    if not conn:
-        print("❌ Database connection failed")
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    else:
-        print("✅ Database connection successful")
-
-    try:
-        with conn.cursor() as cursor:
-            print(f"📝 Fetching planet data from the database for planet ID {planet_id}")
-            cursor.execute("""
-                SELECT id, name, user_id, resources, discovered_at, claimed_at 
-                FROM planets WHERE id = %s
-            """, (planet_id,))
-            planet = cursor.fetchone()
-            print(f"Fetched planet data: {planet}")
-    finally:
-        conn.close()
-        print("🔒 Database connection closed.")
+    # Fetch the owner's username alongside the planet; LEFT JOIN so an ownerless planet still reports as such
+    logger.debug("📝 Fetching planet data from the database for planet ID %s", planet_id)
+    await cursor.execute(_SQL_GET_PLANET_WITH_OWNER, (planet_id,))
+    planet = await cursor.fetchone()
+    logger.debug("Fetched planet data: %s", planet)
 
     if not planet:
-        print(f"❌ Planet with ID {planet_id} not found")
+        logger.warning("❌ Planet with ID %s not found", planet_id)
         raise HTTPException(status_code=404, detail="Planet not found")
 
-    resources = planet[3] if isinstance(planet[3], dict) else json.loads(planet[3])
-    print(f"Resources for planet {planet_id}: {resources}")
-
     planet_data = {
         "id": planet[0],
         "name": planet[1],
         "owner_id": planet[2],
-        "resources": resources,
+        "resources": planet[3],
         "discovered_at": planet[4],
         "claimed_at": planet[5]
     }
-    print(f"Formatted planet data: {planet_data}")
+    logger.debug("Formatted planet data: %s", planet_data)
 
-    owner = get_user_by_id(planet_data["owner_id"])
-    if not owner:
-        print(f"❌ Owner with ID {planet_data['owner_id']} not found")
+    owner_username = planet[6]
+    if owner_username is None:
+        logger.warning("❌ Owner with ID %s not found", planet_data['owner_id'])
         raise HTTPException(status_code=404, detail="Owner user not found")
 
-    print(f"Owner found: {owner}")
-    if current_user.username == owner[1] or current_user.is_admin:
-        print("✅ User has permission to view the planet")
+    logger.debug("Owner found: %s", owner_username)
+    if current_user.username == owner_username or current_user.is_admin:
+        logger.debug("✅ User has permission to view the planet")
         return planet_data
 
-    print(f"❌ User does not have permission to view this planet")
+    logger.warning("❌ User does not have permission to view this planet")
     raise HTTPException(status_code=403, detail="Unauthorized to view this planet")
 
 
 @router.get("/")
-def read_all_planets(current_user: dict = Depends(get_current_user)):
-    print("🌍 Fetching all planets for current user")
-
-    user = get_user_by_username(current_user.username)
-    if not user:
-        print(f"❌ User {current_user.username} not found in DB")
-        raise HTTPException(status_code=404, detail="User not found")
-
-    user_id = str(user[0])
-    print(f"User found. ID: {user_id}")
-    conn = connect_to_db()
-    if not conn:
-        print("❌ Database connection failed")
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    else:
-        print("✅ Database connection successful")
+async def read_all_planets(current_user: TokenData = Depends(get_current_user), cursor: AsyncCursor = Depends(get_cursor)):
+    logger.debug("🌍 Fetching all planets for current user")
 
-    try:
-        with conn.cursor() as cursor:
-            print(f"📝 Fetching all planets for user ID {user_id}")
-            cursor.execute("""
-                SELECT id, name, resources, discovered_at, claimed_at 
-                FROM planets WHERE user_id = %s
-            """, (user_id,))
-            planets = cursor.fetchall()
-            print(f"Fetched planets: {planets}")
-    finally:
-        conn.close()
-        print("🔒 Database connection closed.")
-
-    return [
-        {
-            "id": p[0],
-            "name": p[1],
-            "resources": p[2] if isinstance(p[2], dict) else json.loads(p[2]),
-            "discovered_at": p[3],
-            "claimed_at": p[4]
-        } for p in planets
-    ]
+    user_id = current_user.id
+
+    # Rows come back as dicts already keyed like the response, resources decoded from jsonb by psycopg
+    logger.debug("📝 Fetching all planets for user ID %s", user_id)
+    cursor.row_factory = dict_row
+    await cursor.execute(_SQL_LIST_PLANETS, (user_id,))
+    return await cursor.fetchall()
 
 
 @router.put("/{planet_id}")
-def update_planet(planet_id: str, planet: Planet, current_user: dict = Depends(get_current_user)):
-    print(f"🌍 Updating planet with ID: {planet_id}")
+async def update_planet(planet_id: str, planet: Planet, current_user: TokenData = Depends(get_current_user), cursor: AsyncCursor = Depends(get_cursor)):
+    logger.debug("🌍 Updating planet with ID: %s", planet_id)
     validate_uuid(planet_id)
 
-    user = get_user_by_username(current_user.username)
-    if not user:
-        print(f"❌ User {current_user.username} not found in DB")
-        raise HTTPException(status_code=404, detail="User not found")
-
-    user_id = str(user[0])
-    print(f"User found. ID: {user_id}")
-    resources_json = json.dumps(planet.resources)
-    print(f"Resources as JSON: {resources_json}")
-    conn = connect_to_db()
-    if not conn:
-        print("❌ Database connection failed")
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    else:
-        print("✅ Database connection successful")
+    user_id = current_user.id
 
     try:
-        with conn.cursor() as cursor:
-            print(f"📝 Fetching planet data for update with planet ID {planet_id}")
-            cursor.execute("SELECT user_id FROM planets WHERE id = %s", (planet_id,))
-            existing_planet = cursor.fetchone()
-            print(f"Fetched existing planet data: {existing_planet}")
-            if not existing_planet:
-                print(f"❌ Planet with ID {planet_id} not found")
-                raise HTTPException(status_code=404, detail="Planet not found")
-            if str(existing_planet[0]) != user_id:
-                print(f"❌ User with ID {user_id} is not the owner of this planet")
-                raise HTTPException(status_code=403, detail="Unauthorized to update this planet")
-
-            print(f"📝 Updating planet data with new values for planet ID {planet_id}")
-            cursor.execute("""
-                UPDATE planets 
-                SET name = %s, resources = %s, discovered_at = %s, claimed_at = %s 
-                WHERE id = %s
-            """, (planet.name, resources_json, planet.discovered_at, planet.claimed_at, planet_id))
-            conn.commit()
-            print(f"✅ Planet with ID {planet_id} updated successfully")
-    except Exception as e:
-        print(f"❌ Error during DB update: {e}")
-        raise HTTPException(status_code=500, detail=f"Error updating planet: {str(e)}")
-    finally:
-        conn.close()
-        print("🔒 Database connection closed.")
+        logger.debug("📝 Updating planet data with new values for planet ID %s", planet_id)
+        await cursor.execute(_SQL_UPDATE_OWN_PLANET, (planet.name, Jsonb(planet.resources), planet.discovered_at, planet.claimed_at, planet_id, user_id), prepare=True)
+        await check_owned_write(cursor, _SQL_PLANET_EXISTS, planet_id, "Planet not found", "Unauthorized to update this planet")
+        logger.debug("✅ Planet with ID %s updated successfully", planet_id)
+    except psycopg.Error as e:
+        logger.error("❌ Error during DB update: %s", e)
+        raise HTTPException(status_code=500, detail="Error updating planet")
 
     return {"message": "Planet updated successfully"}
 
 
 @router.delete("/{planet_id}")
-def delete_planet(planet_id: str, current_user: dict = Depends(get_current_user)):
-    print(f"🌍 Deleting planet with ID: {planet_id}")
+async def delete_planet(planet_id: str, current_user: TokenData = Depends(get_current_user), cursor: AsyncCursor = Depends(get_cursor)):
+    logger.debug("🌍 Deleting planet with ID: %s", planet_id)
     validate_uuid(planet_id)
 
-    user = get_user_by_username(current_user.username)
-    if not user:
-        print(f"❌ User {current_user.username} not found in DB")
-        raise HTTPException(status_code=404, detail="User not found")
-
-    user_id = str(user[0])
-    print(f"User found. ID: {user_id}")
-    conn = connect_to_db()
-    if not conn:
-        print("❌ Database connection failed")
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    else:
-        print("✅ Database connection successful")
+    user_id = current_user.id
 
     try:
-        with conn.cursor() as cursor:
-            print(f"📝 Fetching planet data for deletion with planet ID {planet_id}")
-            cursor.execute("SELECT user_id FROM planets WHERE id = %s", (planet_id,))
-            existing_planet = cursor.fetchone()
-            print(f"Fetched existing planet data: {existing_planet}")
-            if not existing_planet:
-                print(f"❌ Planet with ID {planet_id} not found")
-                raise HTTPException(status_code=404, detail="Planet not found")
-            if str(existing_planet[0]) != user_id:
-                print(f"❌ User with ID {user_id} is not the owner of this planet")
-                raise HTTPException(status_code=403, detail="Unauthorized to delete this planet")
-
-            print(f"📝 Deleting planet with ID {planet_id}")
-            cursor.execute("DELETE FROM planets WHERE id = %s", (planet_id,))
-            conn.commit()
-            print(f"✅ Planet with ID {planet_id} deleted successfully")
-    except Exception as e:
-        print(f"❌ Error during DB delete: {e}")
-        raise HTTPException(status_code=500, detail=f"Error deleting planet: {str(e)}")
-    finally:
-        conn.close()
-        print("🔒 Database connection closed.")
+        logger.debug("📝 Deleting planet with ID %s", planet_id)
+        await cursor.execute(_SQL_DELETE_OWN_PLANET, (planet_id, user_id), prepare=True)
+        await check_owned_write(cursor, _SQL_PLANET_EXISTS, planet_id, "Planet not found", "Unauthorized to delete this planet")
+        logger.debug("✅ Planet with ID %s deleted successfully", planet_id)
+    except psycopg.Error as e:
+        logger.error("❌ Error during DB delete: %s", e)
+        raise HTTPException(status_code=500, detail="Error deleting planet")
 
     return {"message": "Planet deleted successfully"}
 
 
 @router.put("/{planet_id}/claim")
-def claim_planet(planet_id: str, current_user: dict = Depends(get_current_user)):
-    print(f"🌍 Claiming planet with ID: {planet_id}")
+async def claim_planet(planet_id: str, current_user: TokenData = Depends(get_current_user), cursor: AsyncCursor = Depends(get_cursor)):
+    logger.debug("🌍 Claiming planet with ID: %s", planet_id)
     validate_uuid(planet_id)
 
-    conn = connect_to_db()
-    if not conn:
-        print("❌ Database connection failed")
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    else:
-        print("✅ Database connection successful")
-
-    user = get_user_by_username(current_user.username)
-    if not user:
-        print(f"❌ User {current_user.username} not found in DB")
-        raise HTTPException(status_code=404, detail="User not found")
-
-    user_id = str(user[0])
-    print(f"User found. ID: {user_id}")
+    user_id = current_user.id
 
     try:
-        with conn.cursor() as cursor:
-            print(f"📝 Fetching planet data for claiming with planet ID {planet_id}")
-            cursor.execute("SELECT user_id, claimed_at FROM planets WHERE id = %s", (planet_id,))
-            planet = cursor.fetchone()
-            print(f"Fetched planet data: {planet}")
-            if not planet:
-                print(f"❌ Planet with ID {planet_id} not found")
-                raise HTTPException(status_code=404, detail="Planet not found")
-            if str(planet[0]) == user_id:
-                print(f"❌ Planet with ID {planet_id} is already claimed by user {user_id}")
-                raise HTTPException(status_code=400, detail="Planet already claimed by you")
-
-            print(f"📝 Updating planet claim data with planet ID {planet_id}")
-            cursor.execute("""
-                UPDATE planets 
-                SET claimed_at = NOW(), user_id = %s
-                WHERE id = %s
-            """, (user_id, planet_id))
-            conn.commit()
-            print(f"✅ Planet with ID {planet_id} claimed successfully")
-    except Exception as e:
-        print(f"❌ Error during DB claim: {e}")
-        raise HTTPException(status_code=500, detail=f"Error claiming planet: {str(e)}")
-    finally:
-        conn.close()
-        print("🔒 Database connection closed.")
+        # Claim unless the user already owns it (unowned planets included), so here a miss on
+        # an existing planet means it's already theirs
+        logger.debug("📝 Updating planet claim data with planet ID %s", planet_id)
+        await cursor.execute(_SQL_CLAIM_PLANET, (user_id, planet_id, user_id), prepare=True)
+        await check_owned_write(cursor, _SQL_PLANET_EXISTS, planet_id, "Planet not found", "Planet already claimed by you", denied_status=400)
+        logger.debug("✅ Planet with ID %s claimed successfully", planet_id)
+    except psycopg.Error as e:
+        logger.error("❌ Error during DB claim: %s", e)
+        raise HTTPException(status_code=500, detail="Error claiming planet")
 
     return {"message": "Planet claimed successfully"}
\ No newline at end of file
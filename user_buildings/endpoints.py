@@ -1,192 +1,131 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from uuid import uuid4, UUID
+import logging
+import psycopg
+from functools import partial
 from auth import TokenData
 from auth.endpoints import get_current_user
-from database.database import connect_to_db
+from psycopg import AsyncCursor
+from psycopg.rows import kwargs_row
+from database.database import check_owned_write, get_cursor
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+_SQL_GET_OWN_PLANET = "SELECT id FROM planets WHERE id = %s AND user_id = %s"
+_SQL_CREATE_USER_BUILDING = """
+    INSERT INTO user_buildings (id, name, planet_id, level, user_id)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+_SQL_GET_USER_BUILDING = "SELECT id, name, planet_id, level, user_id FROM user_buildings WHERE id = %s"
+_SQL_LIST_USER_BUILDINGS = "SELECT id, name, planet_id, level FROM user_buildings WHERE user_id = %s"
+_SQL_UPDATE_OWN_USER_BUILDING = "UPDATE user_buildings SET name = %s, level = %s WHERE id = %s AND user_id = %s"
+_SQL_DELETE_OWN_USER_BUILDING = "DELETE FROM user_buildings WHERE id = %s AND user_id = %s"
+_SQL_USER_BUILDING_EXISTS = "SELECT 1 FROM user_buildings WHERE id = %s"
 
 class UserBuildingRequest(BaseModel):
     name: str
-    planet_id: str
+    planet_id: UUID
     level: int = 1
 
 class UserBuilding(BaseModel):
-    id: str
+    id: UUID
     name: str
-    planet_id: str
+    planet_id: UUID
     level: int
-    user_id: str
-
-    class Config:
-        json_encoders = {
-            UUID: str
-        }
+    user_id: UUID
 
 @router.post("/")
-def create_user_building(user_building_request: UserBuildingRequest, current_user: TokenData = Depends(get_current_user)):
-    print(f"🔧 Creating user building for user {current_user.id} with payload: {user_building_request}")
-
-    conn = connect_to_db()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+async def create_user_building(user_building_request: UserBuildingRequest, current_user: TokenData = Depends(get_current_user), cursor: AsyncCursor = Depends(get_cursor)):
+    logger.debug("🔧 Creating user building for user %s with payload: %s", current_user.id, user_building_request)
 
-    user_building_id = str(uuid4())
-    print(f"🆔 Generated new user building ID: {user_building_id}")
+    user_building_id = uuid4()
+    logger.debug("🆔 Generated new user building ID: %s", user_building_id)
 
     try:
-        with conn.cursor() as cursor:
-            print(f"🔍 Verifying planet ownership for planet_id={user_building_request.planet_id}")
-            cursor.execute("SELECT id FROM planets WHERE id = %s AND user_id = %s",
-                           (user_building_request.planet_id, current_user.id))
-            planet = cursor.fetchone()
-            print(f"🔍 Planet ownership check result: {planet}")
-            if not planet:
-                print(f"❌ Planet {user_building_request.planet_id} not found or not owned by user {current_user.id}")
-                raise HTTPException(status_code=404, detail="Planet not found or not owned by the user")
-
-            print("📥 Inserting new building into database...")
-            cursor.execute("""
-                INSERT INTO user_buildings (id, name, planet_id, level, user_id)
-                VALUES (%s, %s, %s, %s, %s) RETURNING id;
-            """, (
-                user_building_id, user_building_request.name, user_building_request.planet_id, user_building_request.level,
-                current_user.id))
-            conn.commit()
-
-            cursor.execute("SELECT * FROM user_buildings WHERE id = %s", (user_building_id,))
-            inserted_building = cursor.fetchone()
-            print(f"✅ Building inserted: {inserted_building}")
-
-    except Exception as e:
-        print(f"💥 Error during building creation: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error creating user building: {str(e)}")
-    finally:
-        conn.close()
+        logger.debug("🔍 Verifying planet ownership for planet_id=%s", user_building_request.planet_id)
+        await cursor.execute(_SQL_GET_OWN_PLANET, (user_building_request.planet_id, current_user.id))
+        planet = await cursor.fetchone()
+        logger.debug("🔍 Planet ownership check result: %s", planet)
+        if not planet:
+            logger.warning("❌ Planet %s not found or not owned by user %s", user_building_request.planet_id, current_user.id)
+            raise HTTPException(status_code=404, detail="Planet not found or not owned by the user")
+
+        logger.debug("📥 Inserting new building into database...")
+        await cursor.execute(_SQL_CREATE_USER_BUILDING, (
+            user_building_id, user_building_request.name, user_building_request.planet_id, user_building_request.level,
+            current_user.id))
+        logger.debug("✅ Building inserted: %s", user_building_id)
+
+    except psycopg.Error as e:
+        logger.error("💥 Error during building creation: %s", e)
+        raise HTTPException(status_code=500, detail="Error creating user building")
 
     return UserBuilding(id=user_building_id, name=user_building_request.name, planet_id=user_building_request.planet_id,
                         level=user_building_request.level, user_id=current_user.id)
 
 @router.get("/{user_building_id}")
-def get_user_building(user_building_id: str, current_user: TokenData = Depends(get_current_user)):
-    print(f"📦 Fetching user building with ID {user_building_id}...")
+async def get_user_building(user_building_id: UUID, current_user: TokenData = Depends(get_current_user), cursor: AsyncCursor = Depends(get_cursor)):
+    logger.debug("📦 Fetching user building with ID %s...", user_building_id)
 
-    conn = connect_to_db()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT id, name, planet_id, level, user_id FROM user_buildings WHERE id = %s
-            """, (user_building_id,))
-            user_building = cursor.fetchone()
-            print(f"🔍 Query result: {user_building}")
-    finally:
-        conn.close()
+    await cursor.execute(_SQL_GET_USER_BUILDING, (user_building_id,))
+    user_building = await cursor.fetchone()
+    logger.debug("🔍 Query result: %s", user_building)
 
     if user_building:
-        print(f"🔑 Checking access: current_user.id={current_user.id}, building_owner_id={user_building[4]}")
-        if str(user_building[4]) == str(current_user.id):
-            print("✅ User has permission to view this building.")
-            return UserBuilding(id=str(user_building[0]), name=user_building[1], planet_id=str(user_building[2]),
-                                level=user_building[3], user_id=str(user_building[4]))
+        logger.debug("🔑 Checking access: current_user.id=%s, building_owner_id=%s", current_user.id, user_building[4])
+        if user_building[4] == current_user.id:
+            logger.debug("✅ User has permission to view this building.")
+            return UserBuilding(id=user_building[0], name=user_building[1], planet_id=user_building[2],
+                                level=user_building[3], user_id=user_building[4])
         else:
-            print("❌ User does not have permission to view this building.")
+            logger.warning("❌ User does not have permission to view this building.")
             raise HTTPException(status_code=403, detail="Unauthorized to view this building")
 
-    print(f"❌ User building with ID {user_building_id} not found.")
+    logger.warning("❌ User building with ID %s not found.", user_building_id)
     raise HTTPException(status_code=404, detail="User building not found")
 
 @router.get("/")
-def get_all_user_buildings(current_user: TokenData = Depends(get_current_user)):
-    print(f"📋 Fetching all user buildings for user {current_user.id}...")
+async def get_all_user_buildings(current_user: TokenData = Depends(get_current_user), cursor: AsyncCursor = Depends(get_cursor)):
+    logger.debug("📋 Fetching all user buildings for user %s...", current_user.id)
 
-    conn = connect_to_db()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+    # Rows are built straight into UserBuilding; user_id is the filter, so it comes from the token
+    # rather than from every row
+    cursor.row_factory = kwargs_row(partial(UserBuilding, user_id=current_user.id))
+    await cursor.execute(_SQL_LIST_USER_BUILDINGS, (current_user.id,))
+    user_buildings = await cursor.fetchall()
+    logger.debug("✅ Found %s user buildings.", len(user_buildings))
 
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT id, name, planet_id, level, user_id FROM user_buildings WHERE user_id = %s
-            """, (current_user.id,))
-            user_buildings = cursor.fetchall()
-            print(f"✅ Found {len(user_buildings)} user buildings.")
-    finally:
-        conn.close()
-
-    return [
-        UserBuilding(id=str(ub[0]), name=ub[1], planet_id=str(ub[2]), level=ub[3], user_id=str(ub[4]))
-        for ub in user_buildings
-    ]
+    return user_buildings
 
 @router.put("/{user_building_id}")
-def update_user_building(user_building_id: str, user_building_request: UserBuildingRequest,
-                         current_user: TokenData = Depends(get_current_user)):
-    print(f"🔧 Updating user building with ID {user_building_id} for user {current_user.id}")
-
-    conn = connect_to_db()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+async def update_user_building(user_building_id: UUID, user_building_request: UserBuildingRequest,
+                         current_user: TokenData = Depends(get_current_user), cursor: AsyncCursor = Depends(get_cursor)):
+    logger.debug("🔧 Updating user building with ID %s for user %s", user_building_id, current_user.id)
 
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT user_id FROM user_buildings WHERE id = %s", (user_building_id,))
-            user_building = cursor.fetchone()
-            print(f"🔍 Retrieved building owner: {user_building}")
-
-            if not user_building:
-                raise HTTPException(status_code=404, detail="User building not found")
-
-            if str(user_building[0]) != str(current_user.id):
-                print(f"❌ User {current_user.id} is not authorized to update this building.")
-                raise HTTPException(status_code=403, detail="Unauthorized to update this user building")
-
-            print(f"✏️ Updating name to '{user_building_request.name}', level to {user_building_request.level}")
-            cursor.execute("""
-                UPDATE user_buildings SET name = %s, level = %s WHERE id = %s
-            """, (user_building_request.name, user_building_request.level, user_building_id))
-            conn.commit()
-            print("✅ Update successful.")
-    except Exception as e:
-        print(f"💥 Error during building update: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error updating user building: {str(e)}")
-    finally:
-        conn.close()
+        logger.debug("✏️ Updating name to '%s', level to %s", user_building_request.name, user_building_request.level)
+        await cursor.execute(_SQL_UPDATE_OWN_USER_BUILDING, (user_building_request.name, user_building_request.level, user_building_id, current_user.id))
+        await check_owned_write(cursor, _SQL_USER_BUILDING_EXISTS, user_building_id, "User building not found", "Unauthorized to update this user building")
+        logger.debug("✅ Update successful.")
+    except psycopg.Error as e:
+        logger.error("💥 Error during building update: %s", e)
+        raise HTTPException(status_code=500, detail="Error updating user building")
 
     return {"message": "User building updated successfully"}
 
 @router.delete("/{user_building_id}")
-def delete_user_building(user_building_id: str, current_user: TokenData = Depends(get_current_user)):
-    print(f"🗑️ Deleting user building with ID {user_building_id} for user {current_user.id}")
-
-    conn = connect_to_db()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+async def delete_user_building(user_building_id: UUID, current_user: TokenData = Depends(get_current_user), cursor: AsyncCursor = Depends(get_cursor)):
+    logger.debug("🗑️ Deleting user building with ID %s for user %s", user_building_id, current_user.id)
 
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT user_id FROM user_buildings WHERE id = %s", (user_building_id,))
-            user_building = cursor.fetchone()
-            print(f"🔍 Retrieved building owner: {user_building}")
-
-            if not user_building:
-                raise HTTPException(status_code=404, detail="User building not found")
-
-            if str(user_building[0]) != str(current_user.id):
-                print(f"❌ User {current_user.id} is not authorized to delete this building.")
-                raise HTTPException(status_code=403, detail="Unauthorized to delete this user building")
-
-            print("🧨 Deleting building from database...")
-            cursor.execute("DELETE FROM user_buildings WHERE id = %s", (user_building_id,))
-            conn.commit()
-            print("✅ Deletion successful.")
-    except Exception as e:
-        print(f"💥 Error during building deletion: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error deleting user building: {str(e)}")
-    finally:
-        conn.close()
+        logger.debug("🧨 Deleting building from database...")
+        await cursor.execute(_SQL_DELETE_OWN_USER_BUILDING, (user_building_id, current_user.id))
+        await check_owned_write(cursor, _SQL_USER_BUILDING_EXISTS, user_building_id, "User building not found", "Unauthorized to delete this user building")
+        logger.debug("✅ Deletion successful.")
+    except psycopg.Error as e:
+        logger.error("💥 Error during building deletion: %s", e)
+        raise HTTPException(status_code=500, detail="Error deleting user building")
 
     return {"message": "User building deleted successfully"}
@@ -1,98 +1,88 @@
-from fastapi import APIRouter, HTTPException, Depends
+import logging
+import psycopg
+from fastapi import APIRouter, HTTPException, Depends, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from uuid import UUID, uuid4
-import json
-from auth.endpoints import get_current_user
-from database.database import connect_to_db
+from auth.endpoints import TokenData, get_current_user
+from psycopg import AsyncCursor
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+from database.database import check_owned_write, get_cursor, stream_json_array
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+_SQL_CREATE_FLEET = """
+    INSERT INTO user_fleets (id, user_id, planet_id, ships, name)
+    SELECT %s, p.user_id, p.id, %s, %s
+    FROM planets p
+    WHERE p.id = %s AND p.user_id = %s
+    RETURNING id, user_id, planet_id, ships, name
+"""
+_SQL_GET_FLEET = "SELECT id, user_id, planet_id, ships, name FROM user_fleets WHERE id = %s"
+_SQL_LIST_FLEETS = "SELECT id, user_id, planet_id, ships, name FROM user_fleets WHERE user_id = %s"
+_SQL_UPDATE_FLEET = "UPDATE user_fleets SET planet_id = %s, ships = %s, name = %s WHERE id = %s AND user_id = %s"
+_SQL_DELETE_FLEET = "DELETE FROM user_fleets WHERE id = %s AND user_id = %s"
+_SQL_FLEET_EXISTS = "SELECT 1 FROM user_fleets WHERE id = %s"
 
 class UserFleetRequest(BaseModel):
     planet_id: UUID
-    ships: dict
+    ships: dict[str, int]  # ship type -> count
     name: str
 
 class UserFleet(BaseModel):
     id: UUID
     user_id: UUID
     planet_id: UUID
-    ships: dict
+    ships: dict[str, int]
     name: str
 
 @router.post("/")
-def create_user_fleet(user_fleet_request: UserFleetRequest, current_user=Depends(get_current_user)):
-    print("Creating user fleet...")
-    conn = connect_to_db()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
+async def create_user_fleet(user_fleet_request: UserFleetRequest, current_user: TokenData = Depends(get_current_user), cursor: AsyncCursor = Depends(get_cursor)):
+    logger.debug("Creating user fleet...")
     fleet_id = uuid4()
-    ships_json = json.dumps(user_fleet_request.ships)
+    ships = Jsonb(user_fleet_request.ships)
 
     try:
-        with conn.cursor() as cursor:
-            print(f"Checking if planet {user_fleet_request.planet_id} exists for user {current_user.id}")
-            cursor.execute("SELECT id FROM planets WHERE id = %s AND user_id = %s",
-                           (str(user_fleet_request.planet_id), str(current_user.id)))
-            planet = cursor.fetchone()
-            if not planet:
-                raise HTTPException(status_code=404, detail="Planet not found or not owned by the user")
-
-            print(f"Inserting user fleet with ID {fleet_id} into database")
-            cursor.execute("""
-                INSERT INTO user_fleets (id, user_id, planet_id, ships, name)
-                VALUES (%s, %s, %s, %s, %s) RETURNING id;
-            """, (str(fleet_id), str(current_user.id), str(user_fleet_request.planet_id),
-                  ships_json, user_fleet_request.name))
-            conn.commit()
-    except Exception as e:
-        print(f"Error creating user fleet: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error creating user fleet: {str(e)}")
-    finally:
-        conn.close()
-
-    print(f"User fleet with ID {fleet_id} created successfully")
-    return UserFleet(
-        id=fleet_id,
-        user_id=current_user.id,
-        planet_id=user_fleet_request.planet_id,
-        ships=user_fleet_request.ships,
-        name=user_fleet_request.name
-    )
+        # Insert only if the user owns the planet; no row back means it's missing or someone else's.
+        # The response is built from the stored row, so it reflects whatever Postgres saved.
+        logger.debug("Inserting user fleet with ID %s on planet %s for user %s", fleet_id, user_fleet_request.planet_id, current_user.id)
+        cursor.row_factory = dict_row
+        await cursor.execute(_SQL_CREATE_FLEET, (fleet_id, ships, user_fleet_request.name,
+                                                 user_fleet_request.planet_id, current_user.id), prepare=True)
+        row = await cursor.fetchone()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Planet not found or not owned by the user")
+    except psycopg.Error as e:
+        logger.error("Error creating user fleet: %s", e)
+        raise HTTPException(status_code=500, detail="Error creating user fleet")
+
+    logger.debug("User fleet with ID %s created successfully", fleet_id)
+    return Response(UserFleet.model_construct(**row).model_dump_json(), media_type="application/json")
 
 
 @router.get("/{user_fleet_id}")
-def get_user_fleet(user_fleet_id: UUID, current_user=Depends(get_current_user)):
-    print(f"Retrieving user fleet with ID {user_fleet_id}")
-    conn = connect_to_db()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT id, user_id, planet_id, ships, name FROM user_fleets WHERE id = %s
-            """, (str(user_fleet_id),))
-            user_fleet = cursor.fetchone()
-    finally:
-        conn.close()
+async def get_user_fleet(user_fleet_id: UUID, current_user: TokenData = Depends(get_current_user), cursor: AsyncCursor = Depends(get_cursor)):
+    logger.debug("Retrieving user fleet with ID %s", user_fleet_id)
+    await cursor.execute(_SQL_GET_FLEET, (user_fleet_id,), prepare=True)
+    user_fleet = await cursor.fetchone()
 
     if user_fleet:
-        if str(user_fleet[1]) == str(current_user.id):
-            print(f"User fleet with ID {user_fleet_id} found and belongs to the current user")
+        if user_fleet[1] == current_user.id:
+            logger.debug("User fleet with ID %s found and belongs to the current user", user_fleet_id)
 
-            # Check if ships is already a dictionary (no need to parse JSON)
-            ships = user_fleet[3]
-            if isinstance(ships, str):
-                ships = json.loads(ships)
-
-            return UserFleet(
+            # Row values come straight from Postgres, so skip re-validating them
+            fleet = UserFleet.model_construct(
                 id=user_fleet[0],
                 user_id=user_fleet[1],
                 planet_id=user_fleet[2],
-                ships=ships,
+                ships=user_fleet[3],
                 name=user_fleet[4]
             )
+            # Dumped by pydantic-core straight to JSON, like the list below, so FastAPI's
+            # jsonable_encoder never walks the model
+            return Response(fleet.model_dump_json(), media_type="application/json")
 
         raise HTTPException(status_code=403, detail="Unauthorized to view this fleet")
 
@@ -100,94 +90,46 @@ def get_user_fleet(user_fleet_id: UUID, current_user=Depends(get_current_user)):
 
 
 @router.get("/")
-def get_all_user_fleets(current_user=Depends(get_current_user)):
-    print(f"Retrieving all fleets for user {current_user.id}")
-    conn = connect_to_db()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
+async def get_all_user_fleets(current_user: TokenData = Depends(get_current_user)):
+    logger.debug("Retrieving all fleets for user %s", current_user.id)
+    # Streamed straight from the database; rows are already UserFleet-shaped
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT id, planet_id, ships, name FROM user_fleets WHERE user_id = %s
-            """, (str(current_user.id),))
-            user_fleets = cursor.fetchall()
-    finally:
-        conn.close()
-
-    print(f"Found {len(user_fleets)} fleets for user {current_user.id}")
-    return [
-        UserFleet(
-            id=f[0],
-            user_id=current_user.id,
-            planet_id=f[1],
-            ships=json.loads(f[2]) if isinstance(f[2], str) else f[2],  # Ensure correct parsing
-            name=f[3]
-        )
-        for f in user_fleets
-    ]
+        body = await stream_json_array(_SQL_LIST_FLEETS, (current_user.id,))
+    except psycopg.Error as e:
+        logger.error("Error retrieving user fleets: %s", e)
+        raise HTTPException(status_code=500, detail="Error retrieving user fleets")
+    return StreamingResponse(body, media_type="application/json")
 
 
 @router.put("/{user_fleet_id}")
-def update_user_fleet(user_fleet_id: UUID, user_fleet_request: UserFleetRequest,
-                      current_user=Depends(get_current_user)):
-    print(f"Updating user fleet with ID {user_fleet_id}")
-    conn = connect_to_db()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
-    ships_json = json.dumps(user_fleet_request.ships)
+async def update_user_fleet(user_fleet_id: UUID, user_fleet_request: UserFleetRequest,
+                            current_user: TokenData = Depends(get_current_user), cursor: AsyncCursor = Depends(get_cursor)):
+    logger.debug("Updating user fleet with ID %s", user_fleet_id)
+    ships = Jsonb(user_fleet_request.ships)
 
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT user_id FROM user_fleets WHERE id = %s", (str(user_fleet_id),))
-            user_fleet = cursor.fetchone()
-            if not user_fleet:
-                raise HTTPException(status_code=404, detail="User fleet not found")
-
-            if str(user_fleet[0]) != str(current_user.id):
-                raise HTTPException(status_code=403, detail="Unauthorized to update this fleet")
-
-            print(f"Updating fleet ID {user_fleet_id} with new planet {user_fleet_request.planet_id} and ships")
-            cursor.execute("""
-                UPDATE user_fleets SET planet_id = %s, ships = %s, name = %s WHERE id = %s
-            """, (str(user_fleet_request.planet_id), ships_json, user_fleet_request.name, str(user_fleet_id)))
-            conn.commit()
-    except Exception as e:
-        print(f"Error updating user fleet: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error updating user fleet: {str(e)}")
-    finally:
-        conn.close()
-
-    print(f"User fleet with ID {user_fleet_id} updated successfully")
+        logger.debug("Updating fleet ID %s with new planet %s and ships", user_fleet_id, user_fleet_request.planet_id)
+        await cursor.execute(_SQL_UPDATE_FLEET, (user_fleet_request.planet_id, ships, user_fleet_request.name, user_fleet_id, current_user.id), prepare=True)
+        await check_owned_write(cursor, _SQL_FLEET_EXISTS, user_fleet_id, "User fleet not found", "Unauthorized to update this fleet")
+    except psycopg.Error as e:
+        logger.error("Error updating user fleet: %s", e)
+        raise HTTPException(status_code=500, detail="Error updating user fleet")
+
+    logger.debug("User fleet with ID %s updated successfully", user_fleet_id)
     return {"message": "User fleet updated successfully"}
 
 
 @router.delete("/{user_fleet_id}")
-def delete_user_fleet(user_fleet_id: UUID, current_user=Depends(get_current_user)):
-    print(f"Deleting user fleet with ID {user_fleet_id}")
-    conn = connect_to_db()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+async def delete_user_fleet(user_fleet_id: UUID, current_user: TokenData = Depends(get_current_user), cursor: AsyncCursor = Depends(get_cursor)):
+    logger.debug("Deleting user fleet with ID %s", user_fleet_id)
 
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT user_id FROM user_fleets WHERE id = %s", (str(user_fleet_id),))
-            user_fleet = cursor.fetchone()
-            if not user_fleet:
-                raise HTTPException(status_code=404, detail="User fleet not found")
-
-            if str(user_fleet[0]) != str(current_user.id):
-                raise HTTPException(status_code=403, detail="Unauthorized to delete this fleet")
-
-            print(f"Deleting fleet with ID {user_fleet_id} from the database")
-            cursor.execute("DELETE FROM user_fleets WHERE id = %s", (str(user_fleet_id),))
-            conn.commit()
-    except Exception as e:
-        print(f"Error deleting user fleet: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error deleting user fleet: {str(e)}")
-    finally:
-        conn.close()
-
-    print(f"User fleet with ID {user_fleet_id} deleted successfully")
+        logger.debug("Deleting fleet with ID %s from the database", user_fleet_id)
+        await cursor.execute(_SQL_DELETE_FLEET, (user_fleet_id, current_user.id), prepare=True)
+        await check_owned_write(cursor, _SQL_FLEET_EXISTS, user_fleet_id, "User fleet not found", "Unauthorized to delete this fleet")
+    except psycopg.Error as e:
+        logger.error("Error deleting user fleet: %s", e)
+        raise HTTPException(status_code=500, detail="Error deleting user fleet")
+
+    logger.debug("User fleet with ID %s deleted successfully", user_fleet_id)
     return {"message": "User fleet deleted successfully"}
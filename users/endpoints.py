@@ -1,10 +1,23 @@
+import logging
+import psycopg
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, EmailStr
 from uuid import UUID
-from auth.endpoints import get_current_user, get_user_by_username
-from database.database import connect_to_db
+from auth.endpoints import TokenData, get_current_user, get_user_by_username, write_user, USER_BY_ID_CACHE
+from database.database import POOL, stream_json_array
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+_SQL_GET_USER = "SELECT id, username, email, is_admin FROM users WHERE id = %s"
+_SQL_LIST_USERS = "SELECT id, username, email, is_admin FROM users"
+_SQL_UPDATE_USER = """
+    UPDATE users
+    SET username = %s, email = %s, is_admin = %s
+    WHERE id = %s
+"""
+_SQL_DELETE_USER = "DELETE FROM users WHERE id = %s"
 
 
 class UserUpdate(BaseModel):
@@ -14,183 +27,127 @@ class UserUpdate(BaseModel):
 
 
 @router.get("/me")
-def read_users_me(current_user: dict = Depends(get_current_user)):
-    print("👤 /me endpoint hit")
-    user = get_user_by_username(current_user.username)
+async def read_users_me(current_user: TokenData = Depends(get_current_user)):
+    logger.debug("👤 /me endpoint hit")
+    user = await get_user_by_username(current_user.username)
 
     if user:
-        print(f"✅ Found user: {user}")
+        logger.debug("✅ Found user: %s", user)
         return {
-            "id": str(user[0]),
+            "id": user[0],
             "username": user[1],
             "email": user[2],
-            "is_admin": user[4]  # Fixed index from 4 to 3
+            "is_admin": user[3]
         }
 
-    print("❌ User not found")
+    logger.warning("❌ User not found")
     raise HTTPException(status_code=404, detail="User not found")
 
 
-def get_user_by_id(user_id: str):
-    print(f"🔍 Fetching user by ID: {user_id}")
+async def get_user_by_id(user_id: str):
+    logger.debug("🔍 Fetching user by ID: %s", user_id)
     try:
         user_uuid = user_id if isinstance(user_id, UUID) else UUID(user_id)
     except ValueError:
-        print("❌ Invalid UUID format")
+        logger.warning("❌ Invalid UUID format")
         raise HTTPException(status_code=400, detail="Invalid user ID format")
 
-    conn = connect_to_db()
-    if not conn:
-        print("❌ DB connection failed")
-        raise HTTPException(status_code=500, detail="Database connection failed")
+    user = USER_BY_ID_CACHE.get(user_uuid)
+    if user is not None:
+        return user
 
     try:
-        with conn.cursor() as cursor:
-            cursor.execute(
-                "SELECT id, username, email, is_admin FROM users WHERE id = %s",
-                (user_uuid,)
-            )
-            user = cursor.fetchone()
-            print(f"👤 User found: {user}")
-    except Exception as e:
-        print(f"❌ DB error while fetching user: {e}")
-        user = None
-    finally:
-        conn.close()
-
+        # Only a cache miss takes a pooled connection
+        async with POOL.connection() as conn, conn.cursor() as cursor:
+            await cursor.execute(_SQL_GET_USER, (user_uuid,), prepare=True)
+            user = await cursor.fetchone()
+        logger.debug("👤 User found: %s", user)
+    except psycopg.Error as e:
+        logger.error("❌ DB error while fetching user: %s", e)
+        raise HTTPException(status_code=500, detail="Error fetching user")
+
+    if user is not None:
+        USER_BY_ID_CACHE[user_uuid] = user
     return user
 
 
 @router.get("/")
-def read_all_users(current_user: dict = Depends(get_current_user)):
-    print("📋 Fetching all users")
+async def read_all_users(current_user: TokenData = Depends(get_current_user)):
+    logger.debug("📋 Fetching all users")
 
     if not current_user.is_admin:
-        print("🚫 Unauthorized access attempt")
+        logger.warning("🚫 Unauthorized access attempt")
         raise HTTPException(status_code=403, detail="Unauthorized to fetch all users")
 
-    conn = connect_to_db()
-    if not conn:
-        print("❌ DB connection failed")
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
+    # Streamed straight from the database, so memory stays flat however many users there are
     try:
-        with conn.cursor() as cursor:
-            cursor.execute(
-                "SELECT id, username, email, is_admin FROM users"
-            )
-            users = cursor.fetchall()
-            print(f"✅ Users fetched: {len(users)}")
-    except Exception as e:
-        print(f"❌ Error fetching users: {e}")
-        raise HTTPException(status_code=500, detail=f"Error fetching users: {str(e)}")
-    finally:
-        conn.close()
-
-    return [
-        {
-            "id": str(user[0]),
-            "username": user[1],
-            "email": user[2],
-            "is_admin": user[3],
-        }
-        for user in users
-    ]
+        body = await stream_json_array(_SQL_LIST_USERS)
+    except psycopg.Error as e:
+        logger.error("❌ Error fetching users: %s", e)
+        raise HTTPException(status_code=500, detail="Error fetching users")
+    return StreamingResponse(body, media_type="application/json")
 
 
 @router.get("/{user_id}")
-def read_user(user_id: str, current_user: dict = Depends(get_current_user)):
-    print(f"👤 Fetching user with ID: {user_id}")
-    user = get_user_by_id(user_id)
+async def read_user(user_id: str, current_user: TokenData = Depends(get_current_user)):
+    logger.debug("👤 Fetching user with ID: %s", user_id)
+    user = await get_user_by_id(user_id)
 
     if user:
         if current_user.username == user[1] or current_user.is_admin:
-            print(f"✅ Found user: {user}")
+            logger.debug("✅ Found user: %s", user)
             return {
-                "id": str(user[0]),
+                "id": user[0],
                 "username": user[1],
                 "email": user[2],
                 "is_admin": user[3]
             }
 
-        print("🚫 Unauthorized access to user data")
+        logger.warning("🚫 Unauthorized access to user data")
         raise HTTPException(status_code=403, detail="Unauthorized to view this user")
 
-    print("❌ User not found")
+    logger.warning("❌ User not found")
     raise HTTPException(status_code=404, detail="User not found")
 
 
 @router.put("/{user_id}")
-def update_user(user_id: UUID, user_data: UserUpdate, current_user: dict = Depends(get_current_user)):
-    print(f"✏️ Update request for user ID: {user_id}")
+async def update_user(user_id: UUID, user_data: UserUpdate, current_user: TokenData = Depends(get_current_user)):
+    logger.debug("✏️ Update request for user ID: %s", user_id)
 
     if not current_user.is_admin:
-        print("🚫 Only admins can update users")
+        logger.warning("🚫 Only admins can update users")
         raise HTTPException(status_code=403, detail="Only admins can update users")
 
-    conn = connect_to_db()
-    if not conn:
-        print("❌ DB connection failed")
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT id FROM users WHERE id = %s", (user_id,))
-            if not cursor.fetchone():
-                print("❌ User not found")
-                raise HTTPException(status_code=404, detail="User not found")
-
-            cursor.execute("""
-                UPDATE users 
-                SET username = %s, email = %s, is_admin = %s
-                WHERE id = %s
-            """, (user_data.username, user_data.email, user_data.is_admin, user_id))
-            conn.commit()
-            print("✅ User updated successfully")
-
-    except Exception as e:
-        print(f"❌ Error updating user: {e}")
-        raise HTTPException(status_code=500, detail=f"Error updating user: {str(e)}")
-    finally:
-        conn.close()
+        # Admin access is settled above, so no row updated can only mean the user doesn't exist
+        if not await write_user(_SQL_UPDATE_USER, (user_data.username, user_data.email, user_data.is_admin, user_id)):
+            logger.warning("❌ User not found")
+            raise HTTPException(status_code=404, detail="User not found")
+        logger.debug("✅ User updated successfully")
+
+    except psycopg.Error as e:
+        logger.error("❌ Error updating user: %s", e)
+        raise HTTPException(status_code=500, detail="Error updating user")
 
     return {"message": "User updated successfully"}
 
 
 @router.delete("/{user_id}")
-def delete_user(user_id: str, current_user: dict = Depends(get_current_user)):
-    print(f"🗑️ Deletion request for user ID: {user_id}")
+async def delete_user(user_id: UUID, current_user: TokenData = Depends(get_current_user)):
+    logger.debug("🗑️ Deletion request for user ID: %s", user_id)
 
     if not current_user.is_admin:
-        print("🚫 Only admins can delete users")
+        logger.warning("🚫 Only admins can delete users")
         raise HTTPException(status_code=403, detail="Only admins can delete users")
 
     try:
-        user_uuid = UUID(user_id)
-    except ValueError:
-        print("❌ Invalid UUID format")
-        raise HTTPException(status_code=400, detail="Invalid user ID format")
-
-    conn = connect_to_db()
-    if not conn:
-        print("❌ DB connection failed")
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT id FROM users WHERE id = %s", (user_uuid,))
-            if not cursor.fetchone():
-                print("❌ User not found")
-                raise HTTPException(status_code=404, detail="User not found")
-
-            cursor.execute("DELETE FROM users WHERE id = %s", (user_uuid,))
-            conn.commit()
-            print("✅ User deleted successfully")
-
-    except Exception as e:
-        print(f"❌ Error deleting user: {e}")
-        raise HTTPException(status_code=500, detail=f"Error deleting user: {str(e)}")
-    finally:
-        conn.close()
+        if not await write_user(_SQL_DELETE_USER, (user_id,)):
+            logger.warning("❌ User not found")
+            raise HTTPException(status_code=404, detail="User not found")
+        logger.debug("✅ User deleted successfully")
+
+    except psycopg.Error as e:
+        logger.error("❌ Error deleting user: %s", e)
+        raise HTTPException(status_code=500, detail="Error deleting user")
 
     return {"message": "User deleted successfully"}